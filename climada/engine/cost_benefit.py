@@ -989,7 +989,7 @@ class CostBenefit():
                                       - sum_ben, 0)
 
         new_imp.eai_exp = np.array([])
-        new_imp.aai_agg = sum(new_imp.at_event * new_imp.frequency)
+        new_imp.aai_agg = np.dot(new_imp.at_event, new_imp.frequency)
 
         new_imp_dict[new_name] = dict()
         new_imp_dict[new_name]['impact'] = new_imp
@@ -34,6 +34,7 @@ from pathlib import Path
 
 import contextily as ctx
 import numpy as np
+import numba
 from scipy import sparse
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
@@ -409,7 +410,7 @@ class Impact():
         year_set = dict()
 
         for year in years:
-            year_set[year] = sum(self.at_event[orig_year == year])
+            year_set[year] = self.at_event[orig_year == year].sum()
         return year_set
 
     def impact_at_reg(self, agg_regions=None):
@@ -505,7 +506,7 @@ class Impact():
 
         return imp_stats
 
-    def calc_freq_curve(self, return_per=None):
+    def calc_freq_curve(self, return_per=None, top_k=None):
         """Compute impact exceedance frequency curve.
 
         Parameters
@@ -513,18 +514,29 @@ class Impact():
         return_per : np.array, optional
             return periods where to compute
             the exceedance impact. Use impact's frequencies if not provided
+        top_k : int, optional
+            if given, only the ``top_k`` largest impacts are sorted and make up the curve,
+            i.e., the part of the curve with the largest return periods. Their return
+            periods are the same as in the full curve (up to the order of equal impacts).
+            Return periods below the smallest one of this part are interpolated to its
+            smallest impact. Default: None (all impacts)
 
         Returns
         -------
         ImpactFreqCurve
         """
-        # Sort descendingly the impacts per events
-        sort_idxs = np.argsort(self.at_event)[::-1]
-        # Calculate exceedence frequency
-        exceed_freq = np.cumsum(self.frequency[sort_idxs])
+        if top_k is not None and top_k < 1:
+            raise ValueError(f"top_k must be a positive integer, got {top_k}.")
+        if top_k is not None and top_k < self.at_event.size:
+            # select the largest impacts in linear time and sort only those
+            top_idxs = np.argpartition(self.at_event, self.at_event.size - top_k)[-top_k:]
+            sort_idxs = top_idxs[np.argsort(self.at_event[top_idxs])]
+        else:
+            # Sort ascendingly the impacts per events
+            sort_idxs = np.argsort(self.at_event)
         # Set return period and impact exceeding frequency
-        ifc_return_per = 1 / exceed_freq[::-1]
-        ifc_impact = self.at_event[sort_idxs][::-1]
+        ifc_return_per, ifc_impact = _freq_curve(
+            sort_idxs, np.asarray(self.at_event), np.asarray(self.frequency))
 
         if return_per is not None:
             interp_imp = np.interp(return_per, ifc_return_per, ifc_impact)
@@ -1828,3 +1840,36 @@ class ImpactFreqCurve():
             axis.set_xlabel('Return period (year)')
             axis.plot(self.return_per, self.impact, **kwargs)
         return axis
+
+
+# numpy error model: a return period of inf for zero frequencies, as with numpy
+@numba.njit(cache=True, error_model='numpy')
+def _freq_curve(sort_idxs, at_event, frequency):
+    """Compute return periods and impacts of an exceedance frequency curve in one pass
+
+    The exceedance frequency is accumulated from the largest to the smallest impact.
+
+    Parameters
+    ----------
+    sort_idxs : np.array
+        indices sorting ``at_event`` ascendingly
+    at_event : np.array
+        impact per event
+    frequency : np.array
+        frequency per event
+
+    Returns
+    -------
+    return_per : np.array
+        return period of each impact, ascending
+    impact : np.array
+        impacts, ascending
+    """
+    return_per = np.empty(sort_idxs.size)
+    impact = np.empty(sort_idxs.size, dtype=at_event.dtype)
+    exceed_freq = 0.0
+    for i in range(sort_idxs.size - 1, -1, -1):
+        exceed_freq += frequency[sort_idxs[i]]
+        return_per[i] = 1 / exceed_freq
+        impact[i] = at_event[sort_idxs[i]]
+    return return_per, impact
@@ -22,8 +22,11 @@ Define ImpactCalc class.
 __all__ = ['ImpactCalc']
 
 import logging
+import weakref
 import numpy as np
+import numba
 from scipy import sparse
+import pandas as pd
 import geopandas as gpd
 
 from climada import CONFIG
@@ -31,6 +34,12 @@ from climada.engine import Impact
 
 LOGGER = logging.getLogger(__name__)
 
+_EVENT_TILE = 4096
+"""Number of events processed at once by the impact kernel"""
+
+_CSC_CACHE = weakref.WeakKeyDictionary()
+"""Intensity and fraction of hazards as csc matrices, see ``_hazard_csc``"""
+
 
 class ImpactCalc():
     """
@@ -75,7 +84,7 @@ class ImpactCalc():
         return self.hazard.size
 
     def impact(self, save_mat=True, assign_centroids=True,
-               ignore_cover=False, ignore_deductible=False):
+               ignore_cover=False, ignore_deductible=False, precision='fp64'):
         """Compute the impact of a hazard on exposures.
 
         Parameters
@@ -97,6 +106,17 @@ class ImpactCalc():
             if set to True, the column 'deductible' of the exposures GeoDataFrame, if present, is
             ignored and the impact it not reduced through values in this column.
             Default: False
+        precision : str, optional
+            floating point precision of the impact computation without impact matrix, 'fp64'
+            or 'fp32'. With 'fp32', at_event and eai_exp are single precision arrays, which
+            halves the memory traffic at the cost of about 7 significant digits. Not
+            available with ``save_mat``, the impact matrix is computed in 'fp64'.
+            Default: 'fp64'
+
+        Raises
+        ------
+        ValueError
+            if the precision is unknown
 
         Examples
         --------
@@ -112,6 +132,12 @@ class ImpactCalc():
         apply_deductible_to_mat : apply deductible to impact matrix
         apply_cover_to_mat : apply cover to impact matrix
         """
+        if precision not in ('fp64', 'fp32'):
+            raise ValueError(f"Unknown precision {precision}, use 'fp64' or 'fp32'.")
+        if precision == 'fp32' and save_mat:
+            LOGGER.warning("The impact matrix is computed in double precision, "
+                           "precision='fp32' is only used with save_mat=False.")
+
         # check for compability of exposures and hazard type
         if all(name not in self.exposures.gdf.columns for
                name in ['if_', f'if_{self.hazard.haz_type}',
@@ -134,28 +160,37 @@ class ImpactCalc():
             return self._return_empty(save_mat)
         LOGGER.info('Calculating impact for %s assets (>0) and %s events.',
                     exp_gdf.size, self.n_events)
-        imp_mat_gen = self.imp_mat_gen(exp_gdf, impf_col)
 
         insured = ('cover' in exp_gdf and exp_gdf.cover.max() >= 0) \
                or ('deductible' in exp_gdf and exp_gdf.deductible.max() > 0)
         if insured:
             LOGGER.info("cover and/or deductible columns detected,"
                         " going to calculate insured impact")
+
+        if not save_mat:
+            at_event, eai_exp, aai_agg = self.direct_risk_metrics(
+                exp_gdf, impf_col, insured, precision)
+            return Impact.from_eih(
+                self.exposures, self.hazard, at_event, eai_exp, aai_agg
+            )
+
+        imp_mat_gen = self.imp_mat_gen(exp_gdf, impf_col)
+        if insured:
 #TODO: make a better impact matrix generator for insured impacts when
 # the impact matrix is already present
             imp_mat_gen = self.insured_mat_gen(imp_mat_gen, exp_gdf, impf_col)
 
-        return self._return_impact(imp_mat_gen, save_mat)
+        return self._return_impact(imp_mat_gen)
+
+    def _return_impact(self, imp_mat_gen):
+        """Return an impact object with impact matrix from an impact matrix generator
 
-    def _return_impact(self, imp_mat_gen, save_mat):
-        """Return an impact object from an impact matrix generator
+        Without impact matrix, the impact is computed by ``direct_risk_metrics``.
 
         Parameters
         ----------
         imp_mat_gen : generator
             Generator of impact matrix and corresponding exposures index
-        save_mat : boolean
-            if true, save the impact matrix
 
         Returns
         -------
@@ -167,13 +202,8 @@ class ImpactCalc():
         imp_mat_gen : impact matrix generator
         insured_mat_gen: insured impact matrix generator
         """
-        if save_mat:
-            imp_mat = self.stitch_impact_matrix(imp_mat_gen)
-            at_event, eai_exp, aai_agg = \
-                self.risk_metrics(imp_mat, self.hazard.frequency)
-        else:
-            imp_mat = None
-            at_event, eai_exp, aai_agg = self.stitch_risk_metrics(imp_mat_gen)
+        imp_mat = self.stitch_impact_matrix(imp_mat_gen)
+        at_event, eai_exp, aai_agg = self.risk_metrics(imp_mat, self.hazard.frequency)
         return Impact.from_eih(
             self.exposures, self.hazard, at_event, eai_exp, aai_agg, imp_mat
         )
@@ -282,33 +312,67 @@ class ImpactCalc():
             impact matrix and corresponding exposures indices for each chunk.
 
         """
-
-        def _chunk_exp_idx(haz_size, idx_exp_impf):
-            '''
-            Chunk computations in sizes that roughly fit into memory
-            '''
-            max_size = CONFIG.max_matrix_size.int()
-            if haz_size > max_size:
-                raise ValueError(
-                    f"Hazard size '{haz_size}' exceeds maximum matrix size '{max_size}'. "
-                    "Increase max_matrix_size configuration parameter accordingly."
-                )
-            n_chunks = np.ceil(haz_size * len(idx_exp_impf) / max_size)
-            return np.array_split(idx_exp_impf, n_chunks)
-
-        for impf_id in exp_gdf[impf_col].dropna().unique():
+        exp_values_all = exp_gdf.value.values
+        centr = exp_gdf[self.hazard.centr_exp_col].values
+        for impf_id, idx_exp_impf in self._group_by_impf(exp_gdf[impf_col]):
             impf = self.impfset.get_func(
                 haz_type=self.hazard.haz_type, fun_id=impf_id
                 )
-            idx_exp_impf = (exp_gdf[impf_col].values == impf_id).nonzero()[0]
-            for exp_idx in _chunk_exp_idx(self.hazard.size, idx_exp_impf):
-                exp_values = exp_gdf.value.values[exp_idx]
-                cent_idx = exp_gdf[self.hazard.centr_exp_col].values[exp_idx]
+            for exp_idx in self._chunk_exp_idx(idx_exp_impf):
+                exp_values = exp_values_all[exp_idx]
+                cent_idx = centr[exp_idx]
                 yield (
                     self.impact_matrix(exp_values, cent_idx, impf),
                     exp_idx
                     )
 
+    @staticmethod
+    def _group_by_impf(impf_ids):
+        """Group exposure points by impact function
+
+        The ids are bucketized once (factorize, stable argsort), instead of comparing
+        all ids to each impact function id.
+
+        Parameters
+        ----------
+        impf_ids : pd.Series
+            impact function id of each exposure point
+
+        Returns
+        -------
+        list of tuples (impf_id, np.array)
+            impact function ids in order of appearance (NaN excluded) and the sorted
+            indices of the exposure points using them
+        """
+        codes, uniques = pd.factorize(impf_ids)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(uniques.size + 1))
+        return [(impf_id, order[bounds[i]:bounds[i + 1]])
+                for i, impf_id in enumerate(uniques)]
+
+    def _max_matrix_size(self):
+        """Maximum matrix size from the configuration, checked against the hazard size
+
+        Raises
+        ------
+        ValueError
+            if the hazard is larger than the memory limit
+        """
+        haz_size = self.hazard.size
+        max_size = CONFIG.max_matrix_size.int()
+        if haz_size > max_size:
+            raise ValueError(
+                f"Hazard size '{haz_size}' exceeds maximum matrix size '{max_size}'. "
+                "Increase max_matrix_size configuration parameter accordingly."
+            )
+        return max_size
+
+    def _chunk_exp_idx(self, idx_exp_impf):
+        """Chunk computations in sizes that roughly fit into memory"""
+        max_size = self._max_matrix_size()
+        n_chunks = np.ceil(self.hazard.size * len(idx_exp_impf) / max_size)
+        return np.array_split(idx_exp_impf, n_chunks)
+
     def insured_mat_gen(self, imp_mat_gen, exp_gdf, impf_col):
         """
         Generator of insured impact sub-matrices (with applied cover and deductible)
@@ -338,17 +402,22 @@ class ImpactCalc():
         exp_idx : np.array
             Exposure indices for impacts in mat
         """
+        # look up the columns once, not for every sub-matrix
+        impf_ids = exp_gdf[impf_col].values
+        centr = exp_gdf[self.hazard.centr_exp_col].values
+        deductibles = exp_gdf.deductible.values if 'deductible' in exp_gdf else None
+        covers = exp_gdf.cover.values if 'cover' in exp_gdf else None
         for mat, exp_idx in imp_mat_gen:
-            impf_id = exp_gdf[impf_col][exp_idx[0]]
-            cent_idx = exp_gdf[self.hazard.centr_exp_col].values[exp_idx]
+            impf_id = impf_ids[exp_idx[0]]
+            cent_idx = centr[exp_idx]
             impf = self.impfset.get_func(
                 haz_type=self.hazard.haz_type,
                 fun_id=impf_id)
-            if 'deductible' in exp_gdf:
-                deductible = exp_gdf.deductible.values[exp_idx]
+            if deductibles is not None:
+                deductible = deductibles[exp_idx]
                 mat = self.apply_deductible_to_mat(mat, deductible, self.hazard, cent_idx, impf)
-            if 'cover' in exp_gdf:
-                cover = exp_gdf.cover.values[exp_idx]
+            if covers is not None:
+                cover = covers[exp_idx]
                 mat = self.apply_cover_to_mat(mat, cover)
             yield (mat, exp_idx)
 
@@ -429,6 +498,196 @@ class ImpactCalc():
         aai_agg = self.aai_agg_from_eai_exp(eai_exp)
         return at_event, eai_exp, aai_agg
 
+    def direct_risk_metrics(self, exp_gdf, impf_col, insured=False, precision='fp64'):
+        """Compute the impact metrics without building the impact matrix
+
+        All exposure points sharing an impact function are processed by one call to a
+        compiled kernel, which walks through the non-zero hazard intensities at the
+        assigned centroids, evaluates the impact function and aggregates the impacts into
+        ``at_event`` and ``eai_exp`` directly.
+
+        Impact functions with a non-zero mean damage ratio at intensity 0 cannot make use
+        of the sparsity of the hazard. For those, the impact sub-matrices are computed
+        chunk-wise with ``impact_matrix`` as in ``imp_mat_gen``.
+
+        Parameters
+        ----------
+        exp_gdf : GeoDataFrame
+            Geodataframe of the exposures with columns required for impact computation.
+        impf_col : str
+            Name of the column in 'exp_gdf' indicating the impact function (id)
+        insured : bool, optional
+            If True, the columns 'deductible' and 'cover' of 'exp_gdf' are applied to the
+            impacts (if present). Default: False
+        precision : str, optional
+            'fp64' or 'fp32', floating point type of the hazard and impact function values
+            in the kernel and of the returned arrays. Default: 'fp64'
+
+        Returns
+        -------
+        at_event : np.array
+            Accumulated damage for each event
+        eai_exp : np.array
+            Expected impact within a period of 1/frequency_unit for each exposure point
+        aai_agg : float
+            Average impact within a period of 1/frequency_unit aggregated
+
+        Raises
+        ------
+        ValueError
+            if the hazard is larger than the memory limit or the precision is unknown
+
+        See Also
+        --------
+        stitch_risk_metrics : compute the risk metrics from an impact matrix generator
+        """
+        if precision not in ('fp64', 'fp32'):
+            raise ValueError(f"Unknown precision {precision}, use 'fp64' or 'fp32'.")
+        dtype = np.float32 if precision == 'fp32' else np.float64
+        # per event impacts of the blocks of exposure points processed in parallel, kept
+        # for all impact functions
+        at_event_blocks = self._at_event_blocks(dtype)
+        at_event = np.zeros(self.n_events, dtype=dtype)
+        eai_exp = np.zeros(self.n_exp_pnt, dtype=dtype)
+        exp_cols = self._exposure_columns(exp_gdf, insured, dtype)
+        # column access to the hazard, converted once per hazard instead of slicing the
+        # csr matrices
+        haz_arrays = _hazard_kernel_arrays(self.hazard, dtype)
+        for impf_id, exp_idx in self._group_by_impf(exp_gdf[impf_col]):
+            impf = self.impfset.get_func(
+                haz_type=self.hazard.haz_type, fun_id=impf_id
+                )
+            if impf.calc_mdr(0) != 0:
+                self._risk_metrics_dense(exp_cols, exp_idx, impf, at_event, eai_exp)
+            else:
+                self._risk_metrics_kernel(exp_cols, exp_idx, impf, haz_arrays,
+                                          at_event_blocks, eai_exp)
+        at_event += at_event_blocks.sum(axis=0)
+        # accumulate the aggregated impact in double precision
+        return at_event, eai_exp, \
+            self.aai_agg_from_eai_exp(eai_exp.astype(np.float64, copy=False))
+
+    def _at_event_blocks(self, dtype):
+        """Zero impacts per event for each block of exposure points processed in parallel
+        by ``_impact_kernel``, at most one block per thread within the maximum matrix size
+        """
+        n_blocks = min(numba.get_num_threads(),
+                       self._max_matrix_size() // max(self.n_events, 1))
+        return np.zeros((max(n_blocks, 1), self.n_events), dtype=dtype)
+
+    def _exposure_columns(self, exp_gdf, insured, dtype):
+        """Exposure columns used by ``direct_risk_metrics``, looked up and converted once
+        for all impact functions
+
+        Parameters
+        ----------
+        exp_gdf : GeoDataFrame
+            Geodataframe of the exposures with columns required for impact computation.
+        insured : bool
+            Whether deductible and cover are applied (if present)
+        dtype : type
+            floating point type of the values, deductibles and covers
+
+        Returns
+        -------
+        dict
+            the arrays 'value', 'centr', 'deductible' and 'cover', the latter two are None
+            if they are not applied
+        """
+        exp_cols = {
+            'value': exp_gdf.value.values.astype(dtype, copy=False),
+            'centr': exp_gdf[self.hazard.centr_exp_col].values,
+            'deductible': None,
+            'cover': None,
+        }
+        if insured:
+            for col in ['deductible', 'cover']:
+                if col in exp_gdf:
+                    exp_cols[col] = exp_gdf[col].values.astype(dtype, copy=False)
+        return exp_cols
+
+    def _risk_metrics_dense(self, exp_cols, exp_idx, impf, at_event, eai_exp):
+        """Add the impacts of exposure points with an impact function with mdr(0) != 0
+
+        Such impact functions cannot make use of the sparsity of the hazard. The impact
+        sub-matrices are computed chunk-wise with ``impact_matrix`` as in ``imp_mat_gen``.
+
+        Parameters
+        ----------
+        exp_cols : dict
+            exposure columns, see ``_exposure_columns``
+        exp_idx : np.array
+            indices of the exposure points with the impact function
+        impf : ImpactFunc
+            impact function
+        at_event : np.array
+            impact per event, updated in place
+        eai_exp : np.array
+            expected impact per exposure point, updated in place
+        """
+        freq = self.hazard.frequency.astype(eai_exp.dtype, copy=False)
+        for chunk in self._chunk_exp_idx(exp_idx):
+            cent_idx = exp_cols['centr'][chunk]
+            mat = self.impact_matrix(exp_cols['value'][chunk], cent_idx, impf)
+            if exp_cols['deductible'] is not None:
+                mat = self.apply_deductible_to_mat(
+                    mat, exp_cols['deductible'][chunk], self.hazard, cent_idx, impf)
+            if exp_cols['cover'] is not None:
+                mat = self.apply_cover_to_mat(mat, exp_cols['cover'][chunk])
+            at_event += self.at_event_from_mat(mat)
+            eai_exp[self._orig_exp_idx[chunk]] += self.eai_exp_from_mat(mat, freq)
+
+    def _risk_metrics_kernel(self, exp_cols, exp_idx, impf, haz_arrays, at_event_blocks,
+                             eai_exp):
+        """Add the impacts of exposure points sharing an impact function with mdr(0) == 0
+
+        The impacts are computed by ``_impact_kernel``. The deductible, cover and fraction
+        are passed as None if they do not change the impacts, for which the kernel is
+        compiled without the corresponding computations.
+
+        Parameters
+        ----------
+        exp_cols : dict
+            exposure columns, see ``_exposure_columns``
+        exp_idx : np.array
+            indices of the exposure points with the impact function
+        impf : ImpactFunc
+            impact function
+        haz_arrays : tuple
+            csc arrays of the hazard intensity and fraction, see ``_hazard_kernel_arrays``
+        at_event_blocks : np.array
+            impact per block of exposure points and event, updated in place
+        eai_exp : np.array
+            expected impact per exposure point, updated in place
+        """
+        int_indptr = haz_arrays[0]
+        cent_idx = exp_cols['centr'][exp_idx]
+        # exposure points at centroids without any hazard intensity have no impact
+        with_int = int_indptr[cent_idx + 1] > int_indptr[cent_idx]
+        if not with_int.all():
+            exp_idx, cent_idx = exp_idx[with_int], cent_idx[with_int]
+        if exp_idx.size == 0:
+            return
+        deductible = exp_cols['deductible']
+        if deductible is not None:
+            deductible = deductible[exp_idx]
+            # a deductible of 0 does not change the impacts
+            if not np.any(deductible != 0):
+                deductible = None
+        cover = exp_cols['cover']
+        if cover is not None:
+            cover = cover[exp_idx]
+        dtype = eai_exp.dtype
+        eai_exp_impf = np.zeros(exp_idx.size, dtype=dtype)
+        impf_int = np.asarray(impf.intensity, dtype=dtype)
+        _impact_kernel(
+            cent_idx, exp_cols['value'][exp_idx], deductible, cover, *haz_arrays,
+            impf_int, np.asarray(impf.mdd, dtype=dtype), np.asarray(impf.paa, dtype=dtype),
+            _knot_step(impf_int), self.hazard.frequency.astype(dtype, copy=False),
+            at_event_blocks, eai_exp_impf, np.empty((2, exp_idx.size), dtype=np.int64),
+        )
+        eai_exp[self._orig_exp_idx[exp_idx]] += eai_exp_impf
+
     @staticmethod
     def apply_deductible_to_mat(mat, deductible, hazard, cent_idx, impf):
         """
@@ -504,11 +763,8 @@ class ImpactCalc():
         eai_exp : np.array
             expected impact within a period of 1/frequency_unit for each exposure
         """
-        n_events = freq.size
-        freq_csr = sparse.csr_matrix(   #vector n_events x 1
-            (freq, np.zeros(n_events), np.arange(n_events + 1)),
-            shape=(n_events, 1))
-        return mat.multiply(freq_csr).sum(axis=0).A1
+        # one sparse matrix-vector product, no temporary frequency weighted matrix
+        return mat.T.dot(freq)
 
     @staticmethod
     def at_event_from_mat(mat):
@@ -568,3 +824,267 @@ class ImpactCalc():
         at_event = cls.at_event_from_mat(mat)
         aai_agg = cls.aai_agg_from_eai_exp(eai_exp)
         return at_event, eai_exp, aai_agg
+
+
+@numba.njit(cache=True, parallel=True)
+def _impact_kernel(cent_idx, exp_values, deductible, cover,
+                   int_indptr, int_indices, int_data,
+                   fra_indptr, fra_indices, fra_data,
+                   impf_int, impf_mdd, impf_paa, impf_step, freq,
+                   at_event_blocks, eai_exp, positions):
+    """Accumulate the impacts of exposure points sharing one impact function
+
+    The hazard intensity and fraction are given by the arrays of csc matrices
+    (events x centroids) with sorted indices. The impact at each exposure point is added
+    to ``at_event_blocks`` (per event) and its frequency weighted sum is stored in
+    ``eai_exp`` (per exposure point).
+
+    The events are processed in tiles of ``_EVENT_TILE`` events, so that the part of
+    ``at_event_blocks`` and ``freq`` in use stays in cache. For each exposure point, the
+    position of the next non-zero intensity (and fraction) is kept between the tiles.
+    Within a tile, the exposure points are split into as many blocks as
+    ``at_event_blocks`` has rows, and the blocks are processed in parallel. Every block
+    accumulates its impacts per event in its own row, so the summation order of
+    ``at_event`` (and hence its last bits) depends on the number of blocks.
+
+    The deductible, cover and fraction are optional. If they are None, numba compiles a
+    version of the kernel without the corresponding computations.
+
+    Parameters
+    ----------
+    cent_idx : np.array
+        index of the centroid assigned to each exposure point
+    exp_values : np.array
+        value of each exposure point
+    deductible : np.array or None
+        deductible of each exposure point, subtracted from the impacts times paa
+    cover : np.array or None
+        cover of each exposure point, the impacts are clipped to the range [0, cover]
+    int_indptr, int_indices, int_data : np.array
+        csc representation of the hazard intensity
+    fra_indptr, fra_indices, fra_data : np.array or None
+        csc representation of the hazard fraction, which multiplies the impacts
+    impf_int, impf_mdd, impf_paa : np.array
+        intensity, mdd and paa of the impact function
+    impf_step : float
+        spacing of ``impf_int`` if it is equidistant, 0 otherwise
+    freq : np.array
+        frequency of each event
+    at_event_blocks : np.array
+        impact per block of exposure points (rows) and event (columns), updated in place
+    eai_exp : np.array
+        expected impact per exposure point, updated in place
+    positions : np.array
+        scratch buffer with 2 rows and at least as many columns as exposure points, for
+        the positions in the intensity and fraction arrays
+    """
+    n_blocks, n_events = at_event_blocks.shape
+    int_pos = positions[0]
+    fra_pos = positions[1]
+    for i in range(cent_idx.size):
+        int_pos[i] = int_indptr[cent_idx[i]]
+    if fra_indptr is not None:
+        for i in range(cent_idx.size):
+            fra_pos[i] = fra_indptr[cent_idx[i]]
+    for tile_start in range(0, n_events, _EVENT_TILE):
+        tile_end = min(tile_start + _EVENT_TILE, n_events)
+        for block in numba.prange(n_blocks):  # pylint: disable=not-an-iterable
+            for i in range(block, cent_idx.size, n_blocks):
+                _impact_exposure(i, tile_end, int_pos, fra_pos,
+                                 cent_idx, exp_values, deductible, cover,
+                                 int_indptr, int_indices, int_data,
+                                 fra_indptr, fra_indices, fra_data,
+                                 impf_int, impf_mdd, impf_paa, impf_step, freq,
+                                 at_event_blocks[block], eai_exp)
+
+
+@numba.njit(cache=True)
+def _impact_exposure(i, tile_end, int_pos, fra_pos,
+                     cent_idx, exp_values, deductible, cover,
+                     int_indptr, int_indices, int_data,
+                     fra_indptr, fra_indices, fra_data,
+                     impf_int, impf_mdd, impf_paa, impf_step, freq,
+                     at_event, eai_exp):
+    """Add the impacts of the exposure point ``i`` to ``at_event`` and ``eai_exp[i]``
+
+    Only the events from the positions ``int_pos[i]`` and ``fra_pos[i]`` up to (but
+    excluding) ``tile_end`` are processed, and the positions are moved past them. See
+    ``_impact_kernel`` for the other parameters.
+    """
+    # the branches on None arguments are resolved at compile time
+    icen = cent_idx[i]
+    int_end = int_indptr[icen + 1]
+    ifra = fra_pos[i]
+    fra_end = 0
+    if fra_indptr is not None:
+        fra_end = fra_indptr[icen + 1]
+    eai = 0.0
+    k = int_pos[i]
+    while k < int_end and int_indices[k] < tile_end:
+        event = int_indices[k]
+        paa, mdd = _interp_paa_mdd(int_data[k], impf_int, impf_paa, impf_mdd,
+                                   impf_step)
+        impact = paa * mdd * exp_values[i]
+        if fra_data is not None:
+            while ifra < fra_end and fra_indices[ifra] < event:
+                ifra += 1
+            if ifra < fra_end and fra_indices[ifra] == event:
+                impact *= fra_data[ifra]
+            else:
+                impact = 0.0
+        if deductible is not None:
+            impact -= paa * deductible[i]
+        if cover is not None:
+            impact = min(max(impact, 0.0), cover[i])
+        at_event[event] += impact
+        eai += impact * freq[event]
+        k += 1
+    int_pos[i] = k
+    fra_pos[i] = ifra
+    eai_exp[i] += eai
+
+
+@numba.njit(cache=True)
+def _interp_paa_mdd(inten, impf_int, impf_paa, impf_mdd, impf_step):
+    """Interpolate paa and mdd of an impact function at one intensity value
+
+    The interval of ``impf_int`` containing the intensity is searched once and used for
+    both curves. If the intensities are equidistant (``impf_step > 0``), the interval is
+    computed from the step, otherwise it is found by bisection. The result is the same as
+    the one of ``np.interp``, i.e., constant extrapolation beyond the first and last
+    intensity and, for repeated intensity values (step functions), the values right of
+    the step.
+    """
+    last = impf_int.size - 1
+    if inten < impf_int[0]:
+        return impf_paa[0], impf_mdd[0]
+    if inten >= impf_int[last]:
+        return impf_paa[last], impf_mdd[last]
+    # last index j with impf_int[j] <= inten
+    if impf_step > 0 and not np.isnan(inten):
+        low = min(int((inten - impf_int[0]) / impf_step), last - 1)
+        # correct rounding errors of the division
+        while impf_int[low] > inten:
+            low -= 1
+        while impf_int[low + 1] <= inten:
+            low += 1
+    else:
+        low, high = 0, last
+        while high - low > 1:
+            mid = (low + high) // 2
+            if impf_int[mid] <= inten:
+                low = mid
+            else:
+                high = mid
+    if impf_int[low] == inten:
+        return impf_paa[low], impf_mdd[low]
+    return (_interp_segment(inten, impf_int, impf_paa, low),
+            _interp_segment(inten, impf_int, impf_mdd, low))
+
+
+@numba.njit(cache=True)
+def _interp_segment(inten, impf_int, values, j):
+    """Linear interpolation between the points j and j+1 as done by ``np.interp``"""
+    slope = (values[j + 1] - values[j]) / (impf_int[j + 1] - impf_int[j])
+    res = slope * (inten - impf_int[j]) + values[j]
+    if np.isnan(res):
+        res = slope * (inten - impf_int[j + 1]) + values[j + 1]
+        if np.isnan(res) and values[j] == values[j + 1]:
+            res = values[j]
+    return res
+
+
+def _knot_step(impf_int):
+    """Spacing of the intensity values of an impact function
+
+    Parameters
+    ----------
+    impf_int : np.array
+        intensity values of the impact function
+
+    Returns
+    -------
+    float
+        the spacing if the values are strictly increasing and equidistant, 0 otherwise
+    """
+    if impf_int.size < 2:
+        return 0.0
+    step = (impf_int[-1] - impf_int[0]) / (impf_int.size - 1)
+    if step > 0 and np.allclose(np.diff(impf_int), step):
+        return float(step)
+    return 0.0
+
+
+def _hazard_csc(hazard):
+    """Intensity and fraction of a hazard as csc matrices with sorted indices
+
+    The matrices are cached for the lifetime of the hazard, so that repeated impact
+    computations with the same hazard convert them only once. The cache entry is renewed
+    if the intensity or fraction matrix of the hazard (or one of its arrays) is replaced.
+    Changes of the values of the matrices in place are not detected.
+
+    Parameters
+    ----------
+    hazard : Hazard
+        hazard with intensity and fraction matrices
+
+    Returns
+    -------
+    int_csc : sparse.csc_matrix
+        intensity, the hazard's own matrix if it is csc with sorted indices already
+    fra_csc : sparse.csc_matrix or None
+        fraction, None if it is empty (see ``Hazard._get_fraction``) or 1 wherever the
+        intensity is stored
+    """
+    sources = _matrix_objects(hazard.intensity) + _matrix_objects(hazard.fraction)
+    cached = _CSC_CACHE.get(hazard)
+    if cached is not None and len(cached[0]) == len(sources) \
+            and all(ref() is obj for ref, obj in zip(cached[0], sources)) \
+            and cached[1] == (hazard.intensity.nnz, hazard.fraction.nnz):
+        return cached[2], cached[3]
+    int_csc = hazard.intensity.tocsc()
+    if not int_csc.has_sorted_indices:
+        int_csc = int_csc.sorted_indices()
+    fra_csc = hazard._get_fraction()  # pylint: disable=protected-access
+    if fra_csc is not None:
+        fra_csc = fra_csc.tocsc()
+        if not fra_csc.has_sorted_indices:
+            fra_csc = fra_csc.sorted_indices()
+        # a fraction of 1 wherever the intensity is given does not change the impacts
+        if np.array_equal(fra_csc.indptr, int_csc.indptr) \
+                and np.array_equal(fra_csc.indices, int_csc.indices) \
+                and np.all(fra_csc.data == 1):
+            fra_csc = None
+    # weak references, so that replaced matrices are freed and not mistaken for new ones
+    _CSC_CACHE[hazard] = ([weakref.ref(obj) for obj in sources],
+                          (hazard.intensity.nnz, hazard.fraction.nnz), int_csc, fra_csc)
+    return int_csc, fra_csc
+
+
+def _hazard_kernel_arrays(hazard, dtype):
+    """Arrays of the csc intensity and fraction of a hazard as used by ``_impact_kernel``
+
+    Parameters
+    ----------
+    hazard : Hazard
+        hazard with intensity and fraction matrices
+    dtype : type
+        floating point type of the intensity and fraction values
+
+    Returns
+    -------
+    tuple
+        indptr, indices and data of the intensity and of the fraction (None if the
+        fraction does not change the impacts, see ``_hazard_csc``)
+    """
+    int_csc, fra_csc = _hazard_csc(hazard)
+    fra_arrays = (None, None, None) if fra_csc is None else (
+        fra_csc.indptr, fra_csc.indices, fra_csc.data.astype(dtype, copy=False))
+    return (int_csc.indptr, int_csc.indices, int_csc.data.astype(dtype, copy=False),
+            *fra_arrays)
+
+
+def _matrix_objects(mat):
+    """A sparse matrix and its arrays, to detect when one of them is replaced"""
+    return [mat] + [getattr(mat, attr) for attr in ('data', 'indices', 'indptr')
+                    if hasattr(mat, attr)]
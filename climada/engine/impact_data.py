@@ -1055,11 +1055,11 @@ def emdat_to_impact(emdat_file_csv, hazard_type_climada, year_range=None, countr
             countries_reg_id.append(0)
         df_tmp = em_data[em_data[VARNAMES_EMDAT[version]['ISO']].str.contains(cntry)]
         if not reference_year:
-            impact_instance.eai_exp[idx] = sum(np.array(df_tmp["impact"]) *
-                                               impact_instance.frequency[0])
+            impact_instance.eai_exp[idx] = np.sum(np.array(df_tmp["impact"]) *
+                                                  impact_instance.frequency[0])
         else:
-            impact_instance.eai_exp[idx] = sum(np.array(df_tmp["impact_scaled"]) *
-                                               impact_instance.frequency[0])
+            impact_instance.eai_exp[idx] = np.sum(np.array(df_tmp["impact_scaled"]) *
+                                                  impact_instance.frequency[0])
 
     impact_instance.coord_exp = np.stack([countries_lat, countries_lon], axis=1)
     return impact_instance, countries
@@ -268,6 +268,45 @@ class TestFreqCurve(unittest.TestCase):
         self.assertEqual('USD', ifc.unit)
         self.assertEqual('1/day', ifc.frequency_unit)
 
+    def test_ties_pass(self):
+        """Test return periods of events with equal impacts"""
+        imp = Impact()
+        imp.frequency = np.array([0.1, 0.2, 0.1, 0.6])
+        imp.at_event = np.array([5.0, 1.0, 5.0, 0.0])
+
+        ifc = imp.calc_freq_curve()
+        np.testing.assert_array_equal(ifc.impact, [0.0, 1.0, 5.0, 5.0])
+        np.testing.assert_allclose(ifc.return_per, [1.0, 2.5, 5.0, 10.0])
+
+    def test_zero_frequency_pass(self):
+        """Test return period of a largest impact with zero frequency"""
+        imp = Impact()
+        imp.frequency = np.array([0.0, 0.2, 0.1])
+        imp.at_event = np.array([5.0, 1.0, 3.0])
+
+        ifc = imp.calc_freq_curve()
+        np.testing.assert_allclose(ifc.return_per, [1 / 0.3, 10.0, np.inf])
+        np.testing.assert_array_equal(ifc.impact, [1.0, 3.0, 5.0])
+
+        ifc = imp.calc_freq_curve(top_k=2)
+        np.testing.assert_allclose(ifc.return_per, [10.0, np.inf])
+        np.testing.assert_array_equal(ifc.impact, [3.0, 5.0])
+
+    def test_top_k_pass(self):
+        """Test frequency curve of the largest impacts only"""
+        rng = np.random.default_rng(0)
+        imp = Impact()
+        imp.frequency = rng.uniform(0, 0.1, 100)
+        imp.at_event = rng.uniform(0, 1e6, 100)
+
+        ifc = imp.calc_freq_curve()
+        ifc_top = imp.calc_freq_curve(top_k=10)
+        np.testing.assert_array_equal(ifc_top.impact, ifc.impact[-10:])
+        np.testing.assert_allclose(ifc_top.return_per, ifc.return_per[-10:])
+        np.testing.assert_array_equal(imp.calc_freq_curve(top_k=200).impact, ifc.impact)
+        with self.assertRaises(ValueError):
+            imp.calc_freq_curve(top_k=0)
+
     def test_ref_value_rp_pass(self):
         """Test result against reference value with given return periods"""
         imp = Impact()
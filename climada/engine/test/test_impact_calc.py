@@ -22,6 +22,7 @@ import unittest
 from unittest.mock import create_autospec, MagicMock, call, patch
 import numpy as np
 from scipy import sparse
+import pandas as pd
 import geopandas as gpd
 from copy import deepcopy
 from pathlib import Path
@@ -31,7 +32,8 @@ from climada.entity.entity_def import Entity
 from climada.entity import Exposures, ImpactFuncSet, ImpactFunc
 from climada.hazard.base import Hazard
 from climada.engine import ImpactCalc, Impact
-from climada.engine.impact_calc import LOGGER as ILOG
+from climada.engine.impact_calc import (LOGGER as ILOG, _interp_paa_mdd, _knot_step,
+                                        _hazard_csc)
 from climada.util.constants import ENT_DEMO_TODAY, DEMO_DIR
 from climada.util.api_client import Client
 from climada.util.config import Config
@@ -381,6 +383,55 @@ class TestImpactCalc(unittest.TestCase):
         self.assertAlmostEqual(6.570532945599105e+11, impact.tot_value)
         self.assertAlmostEqual(143180396, impact.aai_agg, delta=1)
 
+    def test_calc_impact_save_mat_consistency(self):
+        """Test that the risk metrics do not depend on whether the matrix is saved"""
+        exp = ENT.exposures.copy()
+        exp.gdf.cover /= 1e3
+        exp.gdf.deductible += 1e5
+        # second half of the exposures with an impact function with mdr(0) != 0
+        exp.gdf.loc[25:, 'impf_TC'] = 99
+        impfset = deepcopy(ENT.impact_funcs)
+        impfset.append(ImpactFunc(haz_type='TC', id=99, intensity=np.array([0.0, 50.0, 100.0]),
+                                  mdd=np.array([0.01, 0.5, 1.0]), paa=np.ones(3)))
+        icalc = ImpactCalc(exp, impfset, HAZ)
+        for ignore_insurance in [True, False]:
+            with self.subTest(ignore_insurance=ignore_insurance):
+                imp_mat = icalc.impact(save_mat=True, ignore_cover=ignore_insurance,
+                                       ignore_deductible=ignore_insurance)
+                imp_direct = icalc.impact(save_mat=False, assign_centroids=False,
+                                          ignore_cover=ignore_insurance,
+                                          ignore_deductible=ignore_insurance)
+                np.testing.assert_allclose(imp_direct.at_event, imp_mat.at_event,
+                                           rtol=1e-10, atol=1e-6)
+                np.testing.assert_allclose(imp_direct.eai_exp, imp_mat.eai_exp,
+                                           rtol=1e-10, atol=1e-6)
+                self.assertAlmostEqual(imp_direct.aai_agg / imp_mat.aai_agg, 1.0, 10)
+
+    def test_calc_impact_precision(self):
+        """Test the precision argument of the impact computation"""
+        icalc = ImpactCalc(ENT.exposures, ENT.impact_funcs, HAZ)
+        imp = icalc.impact(save_mat=False, precision='fp32')
+        self.assertEqual(imp.at_event.dtype, np.float32)
+        self.assertEqual(imp.eai_exp.dtype, np.float32)
+        with self.assertLogs(ILOG, level='WARNING') as cm:
+            imp = icalc.impact(save_mat=True, assign_centroids=False, precision='fp32')
+        self.assertIn("precision='fp32' is only used with save_mat=False", cm.output[0])
+        self.assertEqual(imp.at_event.dtype, np.float64)
+        for save_mat in [True, False]:
+            with self.assertRaises(ValueError):
+                icalc.impact(save_mat=save_mat, precision='fp16')
+
+    def test_calc_impact_size_error(self):
+        """Test that a too large hazard raises an error without impact matrix"""
+        max_matrix_size = CONFIG.max_matrix_size.int()
+        CONFIG.max_matrix_size = Config(val=HAZ.size - 1, root=CONFIG)
+        try:
+            icalc = ImpactCalc(ENT.exposures, ENT.impact_funcs, HAZ)
+            with self.assertRaises(ValueError):
+                icalc.impact(save_mat=False)
+        finally:
+            CONFIG.max_matrix_size = Config(val=max_matrix_size, root=CONFIG)
+
     def test_minimal_exp_gdf(self):
         """Test obtain minimal exposures gdf"""
         icalc = ImpactCalc(ENT.exposures, ENT.impact_funcs, HAZ)
@@ -441,6 +492,122 @@ class TestImpactCalc(unittest.TestCase):
         np.testing.assert_array_equal(eai_exp, [2.25, 1.25, 4.5])
         self.assertEqual(aai_agg, 8.0)  # Sum of eai_exp
 
+    def test_direct_risk_metrics(self):
+        """Test computing risk metrics without impact matrix"""
+        haz = Hazard(
+            'TC',
+            event_id=np.array([1, 2]),
+            frequency=np.array([0.5, 0.1]),
+            intensity=sparse.csr_matrix([[0.0, 10.0, 20.0], [5.0, 0.0, 20.0]]),
+            fraction=sparse.csr_matrix([[1.0, 0.5, 1.0], [1.0, 1.0, 0.0]]),
+        )
+        impf = ImpactFunc(haz_type='TC', id=1, intensity=np.array([0.0, 20.0]),
+                          mdd=np.array([0.0, 1.0]), paa=np.array([0.0, 1.0]))
+        icalc = ImpactCalc(Exposures({'blank': [1, 2, 3]}), ImpactFuncSet([impf]), haz)
+        icalc._orig_exp_idx = np.array([0, 1, 2])
+        exp_gdf = gpd.GeoDataFrame({
+            'value': [100.0, 200.0, 300.0], 'impf_TC': [1, 1, 1], 'centr_TC': [1, 2, 0],
+            'deductible': [1.0, 10.0, 2.0], 'cover': [10.0, 1000.0, 1000.0],
+        })
+
+        at_event, eai_exp, aai_agg = icalc.direct_risk_metrics(exp_gdf, 'impf_TC')
+        np.testing.assert_allclose(at_event, [212.5, 18.75])
+        np.testing.assert_allclose(eai_exp, [6.25, 100.0, 1.875])
+        self.assertAlmostEqual(aai_agg, 108.125)
+
+        at_event, eai_exp, aai_agg = icalc.direct_risk_metrics(
+            exp_gdf, 'impf_TC', insured=True)
+        np.testing.assert_allclose(at_event, [200.0, 18.25])
+        np.testing.assert_allclose(eai_exp, [5.0, 95.0, 1.825])
+        self.assertAlmostEqual(aai_agg, 101.825)
+
+        at_event, eai_exp, aai_agg = icalc.direct_risk_metrics(
+            exp_gdf, 'impf_TC', insured=True, precision='fp32')
+        self.assertEqual(at_event.dtype, np.float32)
+        self.assertEqual(eai_exp.dtype, np.float32)
+        np.testing.assert_allclose(at_event, [200.0, 18.25], rtol=1e-6)
+        np.testing.assert_allclose(eai_exp, [5.0, 95.0, 1.825], rtol=1e-6)
+        self.assertAlmostEqual(aai_agg, 101.825, 4)
+
+        with self.assertRaises(ValueError):
+            icalc.direct_risk_metrics(exp_gdf, 'impf_TC', precision='fp16')
+
+        # no intensity at the first centroid
+        haz.intensity[:, 0] = 0
+        haz.intensity.eliminate_zeros()
+        at_event, eai_exp, aai_agg = icalc.direct_risk_metrics(
+            exp_gdf, 'impf_TC', insured=True)
+        np.testing.assert_allclose(at_event, [200.0, 0.0])
+        np.testing.assert_allclose(eai_exp, [5.0, 95.0, 0.0])
+        self.assertAlmostEqual(aai_agg, 100.0)
+
+    def test_interp_paa_mdd(self):
+        """Test interpolation of paa and mdd in the impact kernel against np.interp"""
+        for impf_int in [np.array([0.0, 10.0, 50.0, 100.0]), np.array([0.0, 30.0, 30.0, 100.0]),
+                         np.linspace(0.0, 0.9, 4)]:
+            paa = np.array([0.0, 0.2, 1.0, 1.0])
+            mdd = np.array([0.0, 0.0, 1.0, 1.0])
+            impf_step = _knot_step(impf_int)
+            for inten in [-1.0, 0.0, 0.3, 0.6, 5.0, 10.0, 29.9, 30.0, 42.0, 100.0, 120.0]:
+                self.assertEqual(_interp_paa_mdd(inten, impf_int, paa, mdd, impf_step),
+                                 (np.interp(inten, impf_int, paa),
+                                  np.interp(inten, impf_int, mdd)))
+
+    def test_knot_step(self):
+        """Test detection of equidistant impact function intensities"""
+        self.assertEqual(_knot_step(np.array([0.0, 10.0, 20.0])), 10.0)
+        self.assertAlmostEqual(_knot_step(np.linspace(0.0, 0.9, 4)), 0.3)
+        self.assertEqual(_knot_step(np.array([0.0, 10.0, 50.0])), 0.0)
+        self.assertEqual(_knot_step(np.array([0.0, 30.0, 30.0, 60.0])), 0.0)
+        self.assertEqual(_knot_step(np.array([5.0])), 0.0)
+
+    def test_direct_risk_metrics_csc_hazard(self):
+        """Test that a hazard with unsorted csc matrices is not modified"""
+        # intensity [[0, 10, 20], [5, 0, 20]] with unsorted row indices in last column
+        intensity = sparse.csc_matrix(
+            (np.array([5.0, 10.0, 20.0, 20.0]), np.array([1, 0, 1, 0]), np.array([0, 1, 2, 4])),
+            shape=(2, 3))
+        haz = Hazard('TC', event_id=np.array([1, 2]), frequency=np.array([0.5, 0.1]),
+                     intensity=intensity, fraction=intensity.copy())
+        impf = ImpactFunc(haz_type='TC', id=1, intensity=np.array([0.0, 20.0]),
+                          mdd=np.array([0.0, 1.0]), paa=np.array([0.0, 1.0]))
+        icalc = ImpactCalc(Exposures({'blank': [1, 2, 3]}), ImpactFuncSet([impf]), haz)
+        icalc._orig_exp_idx = np.array([0, 1, 2])
+        exp_gdf = gpd.GeoDataFrame(
+            {'value': [100.0, 200.0, 300.0], 'impf_TC': [1, 1, 1], 'centr_TC': [1, 2, 0]})
+
+        at_event, _, _ = icalc.direct_risk_metrics(exp_gdf, 'impf_TC')
+        np.testing.assert_allclose(at_event, [4250.0, 4093.75])
+        np.testing.assert_array_equal(haz.intensity.indices, [1, 0, 1, 0])
+        np.testing.assert_array_equal(haz.fraction.indices, [1, 0, 1, 0])
+
+    def test_hazard_csc(self):
+        """Test caching of the csc matrices of a hazard"""
+        haz = Hazard('TC', event_id=np.array([1, 2]), frequency=np.array([0.5, 0.1]),
+                     intensity=sparse.csr_matrix([[0.0, 10.0, 20.0], [5.0, 0.0, 20.0]]),
+                     fraction=sparse.csr_matrix((2, 3)))
+        int_csc, fra_csc = _hazard_csc(haz)
+        self.assertEqual(int_csc.format, 'csc')
+        np.testing.assert_array_equal(int_csc.toarray(), haz.intensity.toarray())
+        self.assertIsNone(fra_csc)
+        self.assertIs(_hazard_csc(haz)[0], int_csc)
+
+        # replaced matrices
+        haz.intensity = haz.intensity * 2
+        haz.fraction = sparse.csr_matrix([[1.0, 0.5, 1.0], [1.0, 1.0, 0.0]])
+        int_csc, fra_csc = _hazard_csc(haz)
+        np.testing.assert_array_equal(int_csc.toarray(), haz.intensity.toarray())
+        np.testing.assert_array_equal(fra_csc.toarray(), haz.fraction.toarray())
+
+        # sorted csc matrices are used as they are
+        haz.intensity = int_csc
+        self.assertIs(_hazard_csc(haz)[0], haz.intensity)
+
+        # fraction 1 at the intensity entries is left out
+        haz.fraction = haz.intensity.tocsr(copy=True)
+        haz.fraction.data[:] = 1
+        self.assertIsNone(_hazard_csc(haz)[1])
+
 
 class TestImpactMatrixCalc(unittest.TestCase):
     """Verify the computation of the impact matrix"""
@@ -540,6 +707,13 @@ class TestImpactMatrixGenerator(unittest.TestCase):
             ]
         )
 
+    def test_group_by_impf(self):
+        """Verify the grouping of the exposure points by impact function"""
+        groups = ImpactCalc._group_by_impf(pd.Series([2.0, np.nan, 1.0, 2.0, 1.0]))
+        self.assertEqual([impf_id for impf_id, _ in groups], [2.0, 1.0])
+        np.testing.assert_array_equal(groups[0][1], [0, 3])
+        np.testing.assert_array_equal(groups[1][1], [2, 4])
+
     def test_chunking(self):
         """Verify that chunking works as expected"""
         # n_chunks = hazard.size * len(centr_idx) / max_size = 2 * 5 / 4 = 2.5
@@ -676,14 +850,11 @@ class TestReturnImpact(unittest.TestCase):
         self.icalc.risk_metrics = MagicMock(
             return_value=("at_event", "eai_exp", "aai_agg")
         )
-        self.icalc.stitch_risk_metrics = MagicMock(
-            return_value=("at_event", "eai_exp", "aai_agg")
-        )
         self.imp_mat_gen = "imp_mat_gen"
 
     def test_save_mat(self, from_eih_mock):
         """Test _return_impact when impact matrix is saved"""
-        self.icalc._return_impact(self.imp_mat_gen, save_mat=True)
+        self.icalc._return_impact(self.imp_mat_gen)
         from_eih_mock.assert_called_once_with(
             ENT.exposures,
             HAZ,
@@ -697,26 +868,6 @@ class TestReturnImpact(unittest.TestCase):
         self.icalc.risk_metrics.assert_called_once_with(
             "stitched_matrix", HAZ.frequency
         )
-        self.icalc.stitch_risk_metrics.assert_not_called()
-
-    def test_skip_mat(self, from_eih_mock):
-        """Test _return_impact when impact matrix is NOT saved"""
-        self.icalc._return_impact(self.imp_mat_gen, save_mat=False)
-
-        # Need to check every argument individually due to the last one being a matrix
-        call_args = from_eih_mock.call_args.args
-        self.assertEqual(call_args[0], ENT.exposures)
-        self.assertEqual(call_args[1], HAZ)
-        self.assertEqual(call_args[2], "at_event")
-        self.assertEqual(call_args[3], "eai_exp")
-        self.assertEqual(call_args[4], "aai_agg")
-        np.testing.assert_array_equal(
-            from_eih_mock.call_args.args[-1], sparse.csr_matrix((0, 0)).toarray()
-        )
-
-        self.icalc.stitch_impact_matrix.assert_not_called()
-        self.icalc.risk_metrics.assert_not_called()
-        self.icalc.stitch_risk_metrics.assert_called_once_with(self.imp_mat_gen)
 
 
 # Execute Tests